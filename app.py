@@ -1,10 +1,14 @@
 import os
-from typing import Any, Dict, List, Tuple, Optional
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Tuple, Optional
 
 import pandas as pd
-import psycopg2
 from psycopg2 import sql
+from psycopg2.pool import ThreadedConnectionPool
 import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 from dotenv import load_dotenv
 
 # Para local
@@ -26,6 +30,10 @@ COL_UO = cfg("COL_U_ORGANICA", "u_organica").strip()
 COL_AREA = cfg("COL_AREA", "area").strip()
 COL_DISTANCIA = cfg("COL_DISTANCIA", "dist_km_recta").strip()
 
+PG_POOL_MIN = int(cfg("PG_POOL_MIN", "2"))
+PG_POOL_MAX = int(cfg("PG_POOL_MAX", "10"))
+PG_APP_NAME = cfg("PG_APP_NAME", "destinos_ahp_streamlit").strip()
+
 if not DSN:
     st.error("Falta SUPABASE_PG_DSN (Secrets o .env)")
     st.stop()
@@ -37,29 +45,65 @@ st.title("📋 Destinos (Supabase)")
 # DB helpers
 # ----------------------------
 @st.cache_resource
-def get_conn():
-    conn = psycopg2.connect(DSN, connect_timeout=20)
-    conn.autocommit = True
-    return conn
+def get_pool() -> ThreadedConnectionPool:
+    return ThreadedConnectionPool(
+        minconn=PG_POOL_MIN,
+        maxconn=PG_POOL_MAX,
+        dsn=DSN,
+        connect_timeout=20,
+        application_name=PG_APP_NAME,
+    )
+
+@st.cache_resource
+def get_pool_slots() -> threading.BoundedSemaphore:
+    # getconn() lanza PoolError con el pool agotado: así se espera turno en su lugar
+    return threading.BoundedSemaphore(PG_POOL_MAX)
+
+@contextmanager
+def get_conn() -> Iterator[Any]:
+    pool = get_pool()
+    slots = get_pool_slots()
+    with slots:
+        conn = pool.getconn()
+        try:
+            conn.autocommit = True
+            yield conn
+        finally:
+            # Si la conexión se ha caído, el pool la descarta en vez de reciclarla
+            pool.putconn(conn, close=bool(conn.closed))
+
+def run_parallel(*calls: Callable[[], Any]) -> List[Any]:
+    """
+    Lanza consultas independientes a la vez (cada una con su conexión del pool)
+    y devuelve los resultados en el mismo orden.
+    """
+    ctx = get_script_run_ctx()
+
+    def _run(fn: Callable[[], Any]) -> Any:
+        add_script_run_ctx(ctx=ctx)
+        return fn()
+
+    with ThreadPoolExecutor(max_workers=len(calls)) as ex:
+        return list(ex.map(_run, calls))
 
 def table_ident(schema: str, table: str):
     return sql.SQL("{}.{}").format(sql.Identifier(schema), sql.Identifier(table))
 
 def fetch_df(q: sql.SQL, params: Tuple[Any, ...] = ()) -> pd.DataFrame:
-    conn = get_conn()
-    with conn.cursor() as cur:
+    with get_conn() as conn, conn.cursor() as cur:
         cur.execute(q, params)
         cols = [d[0] for d in cur.description]
         rows = cur.fetchall()
     return pd.DataFrame(rows, columns=cols)
 
 def fetch_one(q: sql.SQL, params: Tuple[Any, ...] = ()) -> Any:
-    conn = get_conn()
-    with conn.cursor() as cur:
+    with get_conn() as conn, conn.cursor() as cur:
         cur.execute(q, params)
         row = cur.fetchone()
     return row[0] if row else None
 
+# Metadatos: la vista cambia poco, no hace falta ir a Postgres en cada rerun
+@st.cache_data(ttl=300, show_spinner=False)
 def fetch_columns(schema: str, table: str) -> List[Dict[str, Any]]:
     q = sql.SQL("""
         SELECT column_name, data_type
@@ -67,35 +111,121 @@ def fetch_columns(schema: str, table: str) -> List[Dict[str, Any]]:
         WHERE table_schema=%s AND table_name=%s
         ORDER BY ordinal_position
     """)
-    conn = get_conn()
-    with conn.cursor() as cur:
+    with get_conn() as conn, conn.cursor() as cur:
         cur.execute(q, (schema, table))
         rows = cur.fetchall()
     return [{"name": r[0], "data_type": r[1]} for r in rows]
 
-def fetch_distinct_values(col: str, limit: int = 5000) -> List[str]:
-    q = sql.SQL("""
-        SELECT DISTINCT {c}
-        FROM {t}
-        WHERE {c} IS NOT NULL
-        ORDER BY {c}
-        LIMIT %s
-    """).format(c=sql.Identifier(col), t=table_ident(SCHEMA, TABLE))
-    dfv = fetch_df(q, (limit,))
-    return dfv[col].astype(str).tolist() if not dfv.empty else []
-
-def fetch_min_max(col: str) -> Tuple[Optional[float], Optional[float]]:
-    q = sql.SQL("SELECT min({c})::float, max({c})::float FROM {t}").format(
-        c=sql.Identifier(col),
-        t=table_ident(SCHEMA, TABLE),
+@st.cache_data(ttl=300, show_spinner=False)
+def fetch_filter_meta(
+    schema: str,
+    table: str,
+    uo_col: Optional[str],
+    area_col: Optional[str],
+    dist_col: Optional[str],
+    limit: int = 5000,
+) -> Tuple[List[str], List[str], Tuple[Optional[float], Optional[float]]]:
+    """
+    Valores de los filtros en una sola consulta: distintos de u_organica y
+    area + min/max de distancia. La CTE se materializa (se usa varias veces),
+    así que la vista se recorre una vez. Columna None -> no se consulta.
+    """
+    present = [c for c in (uo_col, area_col, dist_col) if c]
+    if not present:
+        return [], [], (None, None)
+
+    def distinct_expr(col: Optional[str]) -> sql.Composable:
+        if not col:
+            return sql.SQL("NULL")
+        return sql.SQL("array(SELECT DISTINCT {c} FROM d WHERE {c} IS NOT NULL ORDER BY 1 LIMIT %s)::text[]").format(
+            c=sql.Identifier(col)
+        )
+
+    def agg_expr(fn: str, col: Optional[str]) -> sql.Composable:
+        if not col:
+            return sql.SQL("NULL::float")
+        return sql.SQL("(SELECT {f}({c})::float FROM d)").format(f=sql.SQL(fn), c=sql.Identifier(col))
+
+    q = sql.SQL("WITH d AS (SELECT {cols} FROM {t}) SELECT {uo}, {area}, {dmin}, {dmax}").format(
+        cols=sql.SQL(", ").join(sql.Identifier(c) for c in dict.fromkeys(present)),
+        t=table_ident(schema, table),
+        uo=distinct_expr(uo_col),
+        area=distinct_expr(area_col),
+        dmin=agg_expr("min", dist_col),
+        dmax=agg_expr("max", dist_col),
     )
-    conn = get_conn()
-    with conn.cursor() as cur:
-        cur.execute(q)
-        row = cur.fetchone()
-    if not row:
-        return None, None
-    return row[0], row[1]
+    params = tuple(limit for c in (uo_col, area_col) if c)
+    with get_conn() as conn, conn.cursor() as cur:
+        cur.execute(q, params)
+        uo, area, dmin, dmax = cur.fetchone()
+
+    return (
+        [str(v) for v in uo or []],
+        [str(v) for v in area or []],
+        (dmin, dmax),
+    )
+
+@st.cache_data(ttl=60, show_spinner=False)
+def fetch_page(
+    schema: str,
+    table: str,
+    columns: Tuple[str, ...],
+    where_sql: str,
+    params: Tuple[Any, ...],
+    order_col: str,
+    order_dir: str,
+    page_size: int,
+    offset: int,
+) -> Tuple[pd.DataFrame, int]:
+    """
+    Página de datos + nº de filas que cumplen el filtro (count(*) OVER (),
+    así es un solo scan). Se cachea por (filtro, orden, página) para que
+    cambiar de página o volver a un orden ya visto no repita la consulta.
+    """
+    t = table_ident(schema, table)
+    # Solo las columnas que se muestran: menos bytes por la red que con SELECT *
+    cols_sql = sql.SQL(", ").join(sql.Identifier(c) for c in columns) if columns else sql.SQL("*")
+    q = sql.SQL("SELECT {cols}, count(*) OVER () AS _filtered_total FROM {t}").format(
+        cols=cols_sql, t=t
+    ) + sql.SQL(where_sql)
+
+    if order_col != "(sin ordenar)":
+        q += sql.SQL(" ORDER BY {} {}").format(sql.Identifier(order_col), sql.SQL(order_dir))
+
+    q += sql.SQL(" LIMIT %s OFFSET %s")
+    df = fetch_df(q, tuple(params) + (page_size, offset))
+
+    if not df.empty:
+        filtered_total = int(df["_filtered_total"].iat[0])
+    elif offset == 0:
+        filtered_total = 0
+    else:
+        # Página fuera de rango: no hay fila de la que sacar el total
+        filtered_total = fetch_one(
+            sql.SQL("SELECT count(*) FROM {t}").format(t=t) + sql.SQL(where_sql),
+            tuple(params),
+        )
+    return df.drop(columns=["_filtered_total"]), filtered_total
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def fetch_approx_count(schema: str, table: str) -> int:
+    """
+    Total aproximado desde las estadísticas del planner (pg_class.reltuples),
+    sin recorrer la tabla. Las vistas (o tablas sin ANALYZE) no tienen
+    estimación: en ese caso se cae a count(*) exacto.
+    """
+    est = fetch_one(
+        sql.SQL("""
+            SELECT c.reltuples::bigint
+            FROM pg_class c
+            JOIN pg_namespace n ON n.oid = c.relnamespace
+            WHERE n.nspname = %s AND c.relname = %s
+        """),
+        (schema, table),
+    )
+    if est is not None and est > 0:
+        return int(est)
+    return fetch_one(sql.SQL("SELECT count(*) FROM {t}").format(t=table_ident(schema, table)))
 
 # ----------------------------
 # Sidebar controls
@@ -107,13 +237,21 @@ if not cols_meta:
 
 col_names = [c["name"] for c in cols_meta]
 
+# Valores de los filtros: una sola consulta
+uo_values, area_values, (dmin, dmax) = fetch_filter_meta(
+    SCHEMA,
+    TABLE,
+    COL_UO if COL_UO in col_names else None,
+    COL_AREA if COL_AREA in col_names else None,
+    COL_DISTANCIA if COL_DISTANCIA in col_names else None,
+)
+
 with st.sidebar:
     st.header("Filtros")
 
     # u_organica
     if COL_UO in col_names:
         st.subheader(COL_UO)
-        uo_values = fetch_distinct_values(COL_UO)
         if uo_values:
             selected_uo = st.multiselect(
                 "Incluye u_organica (desmarca para excluir)",
@@ -130,7 +268,6 @@ with st.sidebar:
     # area
     if COL_AREA in col_names:
         st.subheader(COL_AREA)
-        area_values = fetch_distinct_values(COL_AREA)
         if area_values:
             selected_areas = st.multiselect(
                 "Áreas (selecciona las que quieres)",
@@ -149,7 +286,6 @@ with st.sidebar:
     # distancia: slider rango
     if COL_DISTANCIA in col_names:
         st.subheader(COL_DISTANCIA)
-        dmin, dmax = fetch_min_max(COL_DISTANCIA)
         if dmin is None or dmax is None:
             selected_dist_range = None
             st.info("No hay valores en distancia.")
@@ -174,6 +310,10 @@ with st.sidebar:
     page = st.number_input("Página", min_value=1, value=1, step=1)
     offset = (int(page) - 1) * int(page_size)
 
+    # Columnas
+    st.divider()
+    show_cols = st.multiselect("Columnas a mostrar", options=col_names, default=col_names)
+
     # Orden
     st.divider()
     order_col = st.selectbox("Ordenar por", ["(sin ordenar)"] + col_names, index=0)
@@ -212,28 +352,35 @@ def build_where() -> Tuple[sql.SQL, List[Any]]:
         return sql.SQL(""), []
     return sql.SQL(" WHERE ") + sql.SQL(" AND ").join(parts), params
 
-# Persistencia al clicar
+# Persistencia al clicar (el WHERE se guarda ya renderizado para usarlo como clave de caché)
 if "where_sql" not in st.session_state:
-    st.session_state.where_sql = sql.SQL("")
+    st.session_state.where_sql = ""
     st.session_state.params = []
 
 if apply_btn:
     w, p = build_where()
-    st.session_state.where_sql = w
+    with get_conn() as conn:
+        st.session_state.where_sql = w.as_string(conn)
     st.session_state.params = p
 
 where_sql = st.session_state.where_sql
 params = st.session_state.params
 
 # ----------------------------
-# Metrics
+# Data query (paged) + total, en paralelo
 # ----------------------------
-total_count = fetch_one(sql.SQL("SELECT count(*) FROM {t}").format(t=table_ident(SCHEMA, TABLE)))
-filtered_count = fetch_one(
-    sql.SQL("SELECT count(*) FROM {t}").format(t=table_ident(SCHEMA, TABLE)) + where_sql,
-    tuple(params),
+(df, filtered_count), total_count = run_parallel(
+    lambda: fetch_page(
+        SCHEMA, TABLE, tuple(show_cols), where_sql, tuple(params),
+        order_col, order_dir, int(page_size), offset,
+    ),
+    lambda: fetch_approx_count(SCHEMA, TABLE),
 )
 
+# ----------------------------
+# Metrics
+# ----------------------------
+
 c1, c2, c3 = st.columns(3)
 c1.metric("Destinos (filtrados)", f"{filtered_count:,}".replace(",", "."))
 c2.metric("Destinos (total)", f"{total_count:,}".replace(",", "."))
@@ -241,17 +388,6 @@ c3.metric("% sobre total", f"{(filtered_count / total_count * 100) if total_coun
 
 st.divider()
 
-# ----------------------------
-# Data query (paged)
-# ----------------------------
-q = sql.SQL("SELECT * FROM {t}").format(t=table_ident(SCHEMA, TABLE)) + where_sql
-
-if order_col != "(sin ordenar)":
-    q += sql.SQL(" ORDER BY {} {}").format(sql.Identifier(order_col), sql.SQL(order_dir))
-
-q += sql.SQL(" LIMIT %s OFFSET %s")
-df = fetch_df(q, tuple(params) + (page_size, offset))
-
 st.subheader("Tabla")
 st.caption(f"Página {page} · mostrando {len(df)} filas · offset {offset}")
 st.dataframe(df, use_container_width=True, height=520)
@@ -259,6 +395,23 @@ st.dataframe(df, use_container_width=True, height=520)
 # ----------------------------
 # Visuales rápidos
 # ----------------------------
+# Cacheados por contenido de la página: reruns solo de widgets (p.ej. cambiar
+# la columna del histograma) no recalculan los conteos. TTL y tope de entradas
+# como fetch_page: cada página/filtro/orden distinto es una entrada nueva.
+@st.cache_data(ttl=60, max_entries=50, show_spinner=False)
+def top_counts(s: pd.Series, n: int = 15) -> pd.Series:
+    # categoría -> value_counts cuenta sobre los códigos enteros
+    counts = s.astype("category").value_counts(dropna=False).head(n)
+    counts.index = ["NULL" if pd.isna(k) else str(k) for k in counts.index]
+    return counts
+
+@st.cache_data(ttl=60, max_entries=50, show_spinner=False)
+def histogram(s: pd.Series, bins: int = 20) -> pd.Series:
+    series = pd.to_numeric(s, errors="coerce").dropna()
+    if series.empty:
+        return series
+    return pd.cut(series, bins=bins).value_counts().sort_index()
+
 st.divider()
 st.subheader("Vistazos rápidos")
 
@@ -267,14 +420,14 @@ v1, v2, v3 = st.columns(3)
 with v1:
     if COL_UO in df.columns:
         st.markdown("**Top u_organica (página)**")
-        st.bar_chart(df[COL_UO].astype(str).fillna("NULL").value_counts().head(15))
+        st.bar_chart(top_counts(df[COL_UO]))
     else:
         st.info("No hay columna u_organica.")
 
 with v2:
     if COL_AREA in df.columns:
         st.markdown("**Top áreas (página)**")
-        st.bar_chart(df[COL_AREA].astype(str).fillna("NULL").value_counts().head(15))
+        st.bar_chart(top_counts(df[COL_AREA]))
     else:
         st.info("No hay columna area.")
 
@@ -282,13 +435,12 @@ with v3:
     # Histograma simple sobre una columna numérica de la página
     num_cols = [
         c["name"] for c in cols_meta
-        if c["data_type"].lower() in {"smallint", "integer", "bigint", "numeric", "real", "double precision", "decimal"}
+        if c["name"] in df.columns and c["data_type"].lower() in {"smallint", "integer", "bigint", "numeric", "real", "double precision", "decimal"}
     ]
     if num_cols:
         coln = st.selectbox("Numérico (histograma en página)", num_cols, index=0)
-        series = pd.to_numeric(df[coln], errors="coerce").dropna()
-        if len(series) > 0:
-            binned = pd.cut(series, bins=20).value_counts().sort_index()
+        binned = histogram(df[coln])
+        if len(binned) > 0:
             st.bar_chart(binned)
         else:
             st.info("No hay valores numéricos en la página.")
@@ -1,55 +1,117 @@
 import os
 import time
-import math
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import numpy as np
 import pandas as pd
 import streamlit as st
 from dotenv import load_dotenv
+from geopy.exc import GeocoderServiceError
 from geopy.geocoders import Nominatim
 from geopy.extra.rate_limiter import RateLimiter
 
+from geo_cache import GeoCache
+
 load_dotenv()
 
 ORIGIN_ADDRESS = os.getenv("ORIGIN_ADDRESS", "Calle Donato Jiménez, 2, Málaga, España")
 ORS_API_KEY = os.getenv("ORS_API_KEY", "").strip()
+# Plan gratuito de ORS: 40 peticiones/minuto
+ORS_RATE_PER_MIN = int(os.getenv("ORS_RATE_PER_MIN", "40"))
+ORS_MAX_WORKERS = int(os.getenv("ORS_MAX_WORKERS", "10"))
+GEOCODE_CACHE_DB = os.getenv("GEOCODE_CACHE_DB", "geocode_cache.sqlite").strip()
 
 st.set_page_config(page_title="Distancia a Málaga", layout="wide")
 st.title("📍 Cercanía de localidades a Málaga (Calle Donato Jiménez, 2)")
 
 # ---------- Helpers ----------
-def haversine_km(lat1, lon1, lat2, lon2) -> float:
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Vectorizada: acepta escalares o arrays (NaN -> NaN)."""
     # Radio Tierra (km)
     R = 6371.0088
-    phi1, phi2 = math.radians(lat1), math.radians(lat2)
-    dphi = math.radians(lat2 - lat1)
-    dlambda = math.radians(lon2 - lon1)
-    a = math.sin(dphi/2)**2 + math.cos(phi1)*math.cos(phi2)*math.sin(dlambda/2)**2
-    return 2 * R * math.asin(math.sqrt(a))
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1)/2)**2 + np.cos(lat1)*np.cos(lat2)*np.sin((lon2 - lon1)/2)**2
+    return 2 * R * np.arcsin(np.sqrt(a))
 
 @st.cache_resource
 def get_geocoder():
     geolocator = Nominatim(user_agent="ahp_distancias_streamlit")
-    # 1 req/seg para respetar Nominatim
-    geocode = RateLimiter(geolocator.geocode, min_delay_seconds=1, swallow_exceptions=True)
+    # 1 req/seg para respetar Nominatim. Sin tragar excepciones: un timeout o un 429
+    # no debe confundirse con "sin resultado" (que sí se guarda en la caché)
+    geocode = RateLimiter(geolocator.geocode, min_delay_seconds=1, swallow_exceptions=False)
     return geocode
 
+@st.cache_resource
+def get_geo_cache() -> GeoCache:
+    # Persiste entre reinicios: en caliente no se vuelve a llamar a Nominatim
+    return GeoCache(GEOCODE_CACHE_DB)
+
 @st.cache_data
 def geocode_address(addr: str):
+    cache = get_geo_cache()
+    key = addr.strip().lower()
+    if key in cache:
+        return cache[key]
+
     geocode = get_geocoder()
+    # Un fallo transitorio (GeocoderServiceError) se propaga: st.cache_data no
+    # memoriza excepciones y tampoco llega a la caché SQLite, así que se reintenta
     loc = geocode(addr)
-    if not loc:
-        return None
-    return {"lat": loc.latitude, "lon": loc.longitude, "display": loc.address}
+    data = None
+    if loc:
+        data = {"lat": loc.latitude, "lon": loc.longitude, "display": loc.address}
+    cache[key] = data
+    return data
+
+class RateGate:
+    """
+    Limita el ritmo de llamadas compartido entre hilos: reparte huecos
+    separados 60/per_minute segundos y cada llamada espera al suyo.
+    """
+    def __init__(self, per_minute: int):
+        self.interval = 60.0 / max(per_minute, 1)
+        self._lock = threading.Lock()
+        self._next = 0.0
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+        time.sleep(max(0.0, slot - now))
+
+@st.cache_resource
+def get_ors_gate() -> RateGate:
+    # Un único limitador para todo el proceso: todas las sesiones y reruns
+    # comparten el cupo por minuto de la misma API key
+    return RateGate(ORS_RATE_PER_MIN)
+
+@st.cache_resource
+def get_ors_session() -> requests.Session:
+    # Sesión compartida por los hilos: reutiliza conexiones TCP/TLS
+    session = requests.Session()
+    retries = Retry(
+        total=3,
+        backoff_factor=0.3,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=frozenset({"GET", "POST"}),  # directions es idempotente
+        raise_on_status=False,
+    )
+    session.mount("https://", HTTPAdapter(pool_connections=20, pool_maxsize=20, max_retries=retries))
+    session.headers.update({"Authorization": ORS_API_KEY, "Content-Type": "application/json"})
+    return session
 
-def ors_driving(origin, dest):
+def ors_driving(session: requests.Session, origin, dest):
     """
     OpenRouteService driving-car: devuelve km y minutos.
     Requiere ORS_API_KEY en .env
     """
     url = "https://api.openrouteservice.org/v2/directions/driving-car"
-    headers = {"Authorization": ORS_API_KEY, "Content-Type": "application/json"}
     body = {"coordinates": [[origin["lon"], origin["lat"]], [dest["lon"], dest["lat"]]]}
-    r = requests.post(url, json=body, headers=headers, timeout=30)
+    r = session.post(url, json=body, timeout=30)
     r.raise_for_status()
     data = r.json()
     seg = data["features"][0]["properties"]["segments"][0]
@@ -97,7 +159,11 @@ st.dataframe(df.head(30), use_container_width=True)
 
 # Geocode origin
 st.write("### Geocodificando origen…")
-origin = geocode_address(origin_addr)
+try:
+    origin = geocode_address(origin_addr)
+except GeocoderServiceError as e:
+    st.error(f"Nominatim no responde ahora mismo, reintenta en unos segundos. Detalle: {e}")
+    st.stop()
 if not origin:
     st.error("No pude geocodificar la dirección de origen. Revisa el texto.")
     st.stop()
@@ -106,61 +172,72 @@ st.success(f"Origen OK: {origin['display']} ({origin['lat']:.6f}, {origin['lon']
 # Procesar localidades
 st.write("### Calculando distancias…")
 
-results = []
+# Cada localidad distinta se geocodifica (y se enruta) una sola vez,
+# aunque aparezca repetida en el fichero. `codes` lleva cada fila a su localidad única.
+codes, localidades_unicas = pd.factorize(df[col_localidad].astype(str).str.strip())
+n = len(localidades_unicas)
+
+geo_ok = np.zeros(n, dtype=bool)
+lat = np.full(n, np.nan)
+lon = np.full(n, np.nan)
+dist_coche_km = np.full(n, np.nan)
+tiempo_coche_min = np.full(n, np.nan)
+
 progress = st.progress(0)
-n = len(df)
-
-for i, row in df.iterrows():
-    loc_txt = str(row[col_localidad]).strip()
-    query = loc_txt
-    if extra_context.strip():
-        query = f"{loc_txt}, {extra_context.strip()}"
-
-    g = geocode_address(query)
-    if not g:
-        results.append({
-            "localidad": loc_txt,
-            "geo_ok": False,
-            "lat": None, "lon": None,
-            "dist_recta_km": None,
-            "dist_coche_km": None,
-            "tiempo_coche_min": None
-        })
-        progress.progress(min((i+1)/n, 1.0))
-        continue
-
-    dist_recta = haversine_km(origin["lat"], origin["lon"], g["lat"], g["lon"])
-
-    dist_drive_km = None
-    drive_min = None
-    if do_driving and ORS_API_KEY:
-        try:
-            dist_drive_km, drive_min = ors_driving(origin, g)
-            # ORS tiene límites: pequeño delay
-            time.sleep(0.2)
-        except Exception:
-            dist_drive_km, drive_min = None, None
-
-    results.append({
-        "localidad": loc_txt,
-        "geo_ok": True,
-        "lat": g["lat"], "lon": g["lon"],
-        "dist_recta_km": round(dist_recta, 2),
-        "dist_coche_km": round(dist_drive_km, 2) if dist_drive_km is not None else None,
-        "tiempo_coche_min": round(drive_min, 1) if drive_min is not None else None
-    })
+ctx = extra_context.strip()
+n_fallos = 0  # errores transitorios del geocoder (no cacheados)
+
+for i, loc_txt in enumerate(localidades_unicas):
+    query = f"{loc_txt}, {ctx}" if ctx else loc_txt
+
+    try:
+        g = geocode_address(query)
+    except GeocoderServiceError:
+        n_fallos += 1
+        g = None
+    if g:
+        geo_ok[i] = True
+        lat[i], lon[i] = g["lat"], g["lon"]
 
     progress.progress(min((i+1)/n, 1.0))
 
-out = pd.DataFrame(results)
+if n_fallos:
+    st.warning(f"{n_fallos} localidades no se pudieron geocodificar por errores de Nominatim; se reintentarán al recargar.")
 
-# Unir con el df original (manteniendo orden)
-df_out = df.copy()
-df_out["_localidad_key"] = df_out[col_localidad].astype(str).str.strip()
-out["_localidad_key"] = out["localidad"].astype(str).str.strip()
+# En coche (ORS): peticiones HTTP independientes -> en paralelo, respetando el límite por minuto
+if do_driving and ORS_API_KEY:
+    pending = np.flatnonzero(geo_ok).tolist()
+    if pending:
+        st.write("### Calculando rutas en coche…")
+        session = get_ors_session()
+        gate = get_ors_gate()
+
+        def _drive(j):
+            gate.wait()
+            return ors_driving(session, origin, {"lat": lat[j], "lon": lon[j]})
+
+        drive_progress = st.progress(0)
+        with ThreadPoolExecutor(max_workers=ORS_MAX_WORKERS) as ex:
+            futures = {ex.submit(_drive, j): j for j in pending}
+            for done, fut in enumerate(as_completed(futures), start=1):
+                j = futures[fut]
+                try:
+                    dist_coche_km[j], tiempo_coche_min[j] = fut.result()
+                except Exception:
+                    pass
+                drive_progress.progress(done / len(pending))
 
-df_out = df_out.merge(out.drop(columns=["localidad"]), on="_localidad_key", how="left")
-df_out = df_out.drop(columns=["_localidad_key"])
+# Distancia en línea recta: una sola pasada NumPy sobre todas las localidades
+dist_recta_km = np.round(haversine_km(origin["lat"], origin["lon"], lat, lon), 2)
+
+# Resultado alineado por posición con el df original (sin merge)
+df_out = df.copy()
+df_out["geo_ok"] = geo_ok[codes]
+df_out["lat"] = lat[codes]
+df_out["lon"] = lon[codes]
+df_out["dist_recta_km"] = dist_recta_km[codes]
+df_out["dist_coche_km"] = np.round(dist_coche_km, 2)[codes]
+df_out["tiempo_coche_min"] = np.round(tiempo_coche_min, 1)[codes]
 
 st.write("## Resultado")
 st.metric("Localidades (total)", len(df_out))
@@ -1,6 +1,5 @@
 import os
 import re
-import math
 import pandas as pd
 import mysql.connector
 from dotenv import load_dotenv
@@ -8,9 +7,18 @@ from dotenv import load_dotenv
 CSV_PATH = "distancias_malaga.csv"
 TABLE_NAME = "m_destinos_distancias"
 BATCH_SIZE = 1000
+# Filas leídas para inferir los tipos de la tabla (el resto se lee en streaming)
+SAMPLE_ROWS = 10000
 
 load_dotenv()
 
+_RE_WS = re.compile(r"\s+")
+_RE_NON_IDENT = re.compile(r"[^a-z0-9_]")
+_RE_MULTI_US = re.compile(r"_+")
+
+# LOAD DATA LOCAL INFILE: el servidor lee el CSV directamente (requiere local_infile=ON)
+USE_LOAD_DATA = os.getenv("USE_LOAD_DATA", "0") == "1"
+
 def mysql_conn():
     return mysql.connector.connect(
         host=os.getenv("MYSQL_HOST", "127.0.0.1"),
@@ -18,6 +26,7 @@ def mysql_conn():
         user=os.getenv("MYSQL_USER"),
         password=os.getenv("MYSQL_PASSWORD"),
         database=os.getenv("MYSQL_DATABASE"),
+        allow_local_infile=USE_LOAD_DATA,
     )
 
 def sanitize_columns(cols):
@@ -35,9 +44,9 @@ def sanitize_columns(cols):
             idx += 1
 
         name = name.lower()
-        name = re.sub(r"\s+", "_", name)
-        name = re.sub(r"[^a-z0-9_]", "_", name)
-        name = re.sub(r"_+", "_", name).strip("_")
+        name = _RE_WS.sub("_", name)
+        name = _RE_NON_IDENT.sub("_", name)
+        name = _RE_MULTI_US.sub("_", name).strip("_")
         if not name:
             name = f"col_{idx}"
             idx += 1
@@ -65,7 +74,9 @@ def mysql_type_for_series(s: pd.Series) -> str:
 
     # texto
     try:
-        max_len = int(s.astype(str).map(len).max())
+        # str.len() sobre dtype "string": longitud calculada en C, sin ints de Python por fila
+        max_len = s.dropna().astype("string").str.len().max()
+        max_len = 0 if pd.isna(max_len) else int(max_len)
     except Exception:
         max_len = 255
 
@@ -88,30 +99,9 @@ def create_table(cur, table: str, df: pd.DataFrame):
     )
     cur.execute(ddl)
 
-def to_mysql_values(row):
-    """Convierte NaN/NaT a None de forma segura (incluye floats)."""
-    out = []
-    for v in row:
-        if v is None:
-            out.append(None)
-            continue
-        # pandas NaT / numpy nan
-        try:
-            if isinstance(v, float) and math.isnan(v):
-                out.append(None)
-                continue
-        except Exception:
-            pass
-        # pandas missing
-        if pd.isna(v):
-            out.append(None)
-            continue
-        out.append(v)
-    return tuple(out)
-
 def insert_df(cur, table: str, df: pd.DataFrame):
-    # CLAVE: forzar object para que None NO vuelva a nan
-    df2 = df.copy().astype(object)
+    # CLAVE: forzar object para que None NO vuelva a nan (máscara NaN/NaT de una pasada)
+    df2 = df.astype(object).where(pd.notna(df), None)
 
     cols = list(df2.columns)
     col_sql = ", ".join([f"`{c}`" for c in cols])
@@ -121,23 +111,58 @@ def insert_df(cur, table: str, df: pd.DataFrame):
     total = len(df2)
     for start in range(0, total, BATCH_SIZE):
         batch = df2.iloc[start:start + BATCH_SIZE]
-        values = [to_mysql_values(row) for row in batch.values.tolist()]
-        cur.executemany(q, values)
-        print(f"[OK] Insertadas {min(start + BATCH_SIZE, total)}/{total}")
+        cur.executemany(q, batch.values.tolist())
+
+def load_data_infile(cur, table: str, path: str, df: pd.DataFrame):
+    """
+    Carga el CSV con LOAD DATA LOCAL INFILE en una sola sentencia.
+    Las columnas van por posición (mismo orden que la cabecera del CSV);
+    vacío -> NULL y los booleanos de pandas (True/False) -> 1/0.
+    """
+    targets = []
+    sets = []
+    for i, c in enumerate(df.columns):
+        var = f"@v{i}"
+        targets.append(var)
+        if pd.api.types.is_bool_dtype(df[c]):
+            expr = f"IF({var} = '', NULL, {var} IN ('True', 'true', '1'))"
+        else:
+            expr = f"NULLIF({var}, '')"
+        sets.append(f"`{c}` = {expr}")
+
+    q = (
+        f"LOAD DATA LOCAL INFILE %s INTO TABLE `{table}` CHARACTER SET utf8mb4 "
+        "FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '\"' ESCAPED BY '' "
+        "LINES TERMINATED BY '\\n' IGNORE 1 LINES "
+        f"({', '.join(targets)}) SET {', '.join(sets)}"
+    )
+    cur.execute(q, (os.path.abspath(path),))
+    print(f"[OK] Cargadas {cur.rowcount} filas con LOAD DATA")
 
 def main():
-    df = pd.read_csv(CSV_PATH)
+    # muestra para inferir tipos; los datos se leen después por trozos
+    sample = pd.read_csv(CSV_PATH, nrows=SAMPLE_ROWS)
 
     # sanea columnas
-    df.columns = sanitize_columns(df.columns)
+    cols = sanitize_columns(sample.columns)
+    sample.columns = cols
 
     cnx = mysql_conn()
     try:
         cur = cnx.cursor()
-        create_table(cur, TABLE_NAME, df)
+        create_table(cur, TABLE_NAME, sample)
         cnx.commit()
 
-        insert_df(cur, TABLE_NAME, df)
+        if USE_LOAD_DATA:
+            load_data_infile(cur, TABLE_NAME, CSV_PATH, sample)
+        else:
+            # memoria O(BATCH_SIZE): nunca está el CSV entero en un DataFrame
+            total = 0
+            for chunk in pd.read_csv(CSV_PATH, chunksize=BATCH_SIZE):
+                chunk.columns = cols
+                insert_df(cur, TABLE_NAME, chunk)
+                total += len(chunk)
+                print(f"[OK] Insertadas {total}")
         cnx.commit()
 
         print(f"[DONE] Insertado en {os.getenv('MYSQL_DATABASE')}.{TABLE_NAME}")
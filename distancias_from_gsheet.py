@@ -1,28 +1,48 @@
 import os
-import json
-import math
 import time
 from typing import Dict, Any, Optional
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import numpy as np
 import pandas as pd
 from dotenv import load_dotenv
+from geopy.exc import GeocoderServiceError
 from geopy.geocoders import Nominatim
 from geopy.extra.rate_limiter import RateLimiter
 
+from geo_cache import GeoCache
 
-def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+
+# Sesión HTTP reutilizable (keep-alive) con reintentos ante errores transitorios
+_SESSION = requests.Session()
+_SESSION.mount(
+    "https://",
+    HTTPAdapter(
+        pool_connections=10,
+        pool_maxsize=20,
+        max_retries=Retry(
+            total=3,
+            backoff_factor=0.3,
+            status_forcelist=[429, 500, 502, 503, 504],
+            raise_on_status=False,
+        ),
+    ),
+)
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    # Vectorizada: admite escalares o arrays de NumPy (NaN -> NaN)
     R = 6371.0088
-    phi1, phi2 = math.radians(lat1), math.radians(lat2)
-    dphi = math.radians(lat2 - lat1)
-    dl = math.radians(lon2 - lon1)
-    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dl / 2) ** 2
-    return 2 * R * math.asin(math.sqrt(a))
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * R * np.arcsin(np.sqrt(a))
 
 
 def sheet_export_csv(sheet_id: str, gid: str) -> pd.DataFrame:
     url = f"https://docs.google.com/spreadsheets/d/{sheet_id}/export?format=csv&gid={gid}"
-    r = requests.get(url, timeout=30)
+    r = _SESSION.get(url, timeout=30)
     # Si está privado, Google suele responder 403 o HTML de login
     if r.status_code != 200 or "text/html" in r.headers.get("Content-Type", ""):
         raise RuntimeError(
@@ -34,33 +54,23 @@ def sheet_export_csv(sheet_id: str, gid: str) -> pd.DataFrame:
     return pd.read_csv(StringIO(r.text))
 
 
-def load_cache(path: str) -> Dict[str, Any]:
-    if os.path.exists(path):
-        try:
-            with open(path, "r", encoding="utf-8") as f:
-                return json.load(f)
-        except Exception:
-            return {}
-    return {}
-
-
-def save_cache(path: str, cache: Dict[str, Any]) -> None:
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(cache, f, ensure_ascii=False, indent=2)
-
-
 def make_geocoder():
     geolocator = Nominatim(user_agent="ahp_distancias_script")
-    # Respeta Nominatim: mínimo 1 segundo entre peticiones
-    return RateLimiter(geolocator.geocode, min_delay_seconds=1, swallow_exceptions=True)
+    # Respeta Nominatim: mínimo 1 segundo entre peticiones. Sin tragar excepciones:
+    # un timeout o un 429 no debe guardarse como "sin resultado" en la caché
+    return RateLimiter(geolocator.geocode, min_delay_seconds=1, swallow_exceptions=False)
 
 
-def geocode_cached(query: str, geocode_fn, cache: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+def geocode_cached(query: str, geocode_fn, cache: GeoCache) -> Optional[Dict[str, Any]]:
     key = query.strip().lower()
     if key in cache:
         return cache[key]
 
-    loc = geocode_fn(query)
+    try:
+        loc = geocode_fn(query)
+    except GeocoderServiceError:
+        # fallo transitorio: no se persiste, se reintentará en la próxima ejecución
+        return None
     if not loc:
         cache[key] = None
         return None
@@ -81,7 +91,7 @@ def main():
     country_suffix = os.getenv("COUNTRY_SUFFIX", "España").strip()
 
     out_csv = os.getenv("OUT_CSV", "distancias_malaga.csv").strip()
-    cache_file = os.getenv("CACHE_FILE", "geocode_cache.json").strip()
+    cache_file = os.getenv("CACHE_FILE", "geocode_cache.sqlite").strip()
 
     if not sheet_id:
         raise SystemExit("Falta SHEET_ID en el .env")
@@ -93,61 +103,54 @@ def main():
             f"No encuentro la columna '{localidad_col}'. Columnas disponibles: {list(df.columns)}"
         )
 
-    # 2) Preparar lista de localidades (únicas, limpias)
+    # 2) Preparar localidades limpias; `codes` lleva cada fila a su localidad única
     localidades = (
         df[localidad_col]
         .astype(str)
         .str.strip()
         .replace({"nan": ""})
     )
-    localidades = [x for x in localidades.tolist() if x]
+    codes, unicas = pd.factorize(localidades)
+    n = len(unicas)
+    geo_ok = np.zeros(n, dtype=bool)
+    lat = np.full(n, np.nan)
+    lon = np.full(n, np.nan)
 
     # 3) Geocoder + cache
-    cache = load_cache(cache_file)
+    cache = GeoCache(cache_file, commit_every=100)
     geocode_fn = make_geocoder()
 
-    # 4) Geocodificar origen
-    origin = geocode_cached(origin_address, geocode_fn, cache)
-    if not origin:
-        raise SystemExit(f"No pude geocodificar el origen: {origin_address}")
-
-    # 5) Calcular distancias por localidad
-    rows = []
-    total = len(localidades)
-    for i, loc in enumerate(localidades, start=1):
-        query = f"{loc}, {country_suffix}" if country_suffix else loc
-        g = geocode_cached(query, geocode_fn, cache)
-
-        if not g:
-            rows.append({
-                "Localidad": loc,
-                "geo_ok": False,
-                "lat": None,
-                "lon": None,
-                "dist_km_recta": None
-            })
-        else:
-            dkm = haversine_km(origin["lat"], origin["lon"], g["lat"], g["lon"])
-            rows.append({
-                "Localidad": loc,
-                "geo_ok": True,
-                "lat": g["lat"],
-                "lon": g["lon"],
-                "dist_km_recta": round(dkm, 2)
-            })
-
-        # Guarda cache cada 25 para no perder trabajo
-        if i % 25 == 0:
-            save_cache(cache_file, cache)
-            print(f"[INFO] {i}/{total} procesadas...")
-
-    save_cache(cache_file, cache)
-
-    # 6) Unir resultado al DF original (por localidad)
-    out = pd.DataFrame(rows)
-    df_out = df.merge(out, how="left", left_on=localidad_col, right_on="Localidad")
-    # Si no quieres duplicar la columna:
-    # df_out = df_out.drop(columns=["Localidad_y"]).rename(columns={"Localidad_x": "Localidad"})
+    try:
+        # 4) Geocodificar origen
+        origin = geocode_cached(origin_address, geocode_fn, cache)
+        if not origin:
+            raise SystemExit(f"No pude geocodificar el origen: {origin_address}")
+
+        # 5) Geocodificar cada localidad distinta una vez
+        for i, loc in enumerate(unicas):
+            if not loc:
+                continue
+            query = f"{loc}, {country_suffix}" if country_suffix else loc
+            g = geocode_cached(query, geocode_fn, cache)
+            if g:
+                geo_ok[i] = True
+                lat[i], lon[i] = g["lat"], g["lon"]
+
+            if (i + 1) % 25 == 0:
+                print(f"[INFO] {i + 1}/{n} procesadas...")
+    finally:
+        # confirma lo pendiente aunque el proceso falle a mitad
+        cache.close()
+
+    dist_km_recta = np.round(haversine_km(origin["lat"], origin["lon"], lat, lon), 2)
+
+    # 6) Resultado alineado por posición con el DF original (sin merge)
+    df_out = df.copy()
+    df_out["Localidad"] = localidades.where(localidades != "")
+    df_out["geo_ok"] = geo_ok[codes]
+    df_out["lat"] = lat[codes]
+    df_out["lon"] = lon[codes]
+    df_out["dist_km_recta"] = dist_km_recta[codes]
     df_out.to_csv(out_csv, index=False, encoding="utf-8")
     print(f"[OK] CSV generado: {out_csv}")
 
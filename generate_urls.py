@@ -24,12 +24,17 @@ GOOD_CONDITION = os.getenv("GOOD_CONDITION", "0") == "1"
 
 BASE = "https://www.idealista.com/es/geo/alquiler-viviendas"
 
-def slugify(text: str) -> str:
-    t = unidecode(str(text)).lower().strip()
-    t = re.sub(r"[^\w\s-]", "", t)
-    t = re.sub(r"\s+", "-", t)
-    t = re.sub(r"-{2,}", "-", t)
-    return t.strip("-")
+_RE_NONWORD = re.compile(r"[^\w\s-]")
+_RE_WS = re.compile(r"\s+")
+_RE_DASH = re.compile(r"-{2,}")
+
+def slugify_series(s: pd.Series) -> pd.Series:
+    """Slug de cada valor; cada regex se aplica una vez a toda la columna."""
+    t = s.astype(str).map(unidecode).str.lower().str.strip()
+    t = t.str.replace(_RE_NONWORD, "", regex=True)
+    t = t.str.replace(_RE_WS, "-", regex=True)
+    t = t.str.replace(_RE_DASH, "-", regex=True)
+    return t.str.strip("-")
 
 def get_sheets_service():
     creds = service_account.Credentials.from_service_account_file(SA_JSON_PATH, scopes=SCOPES)
@@ -54,8 +59,9 @@ def read_sheet_as_df(service, spreadsheet_id: str, sheet_title: str) -> pd.DataF
     rows = [r + [""] * (max_len - len(r)) for r in rows]
     return pd.DataFrame(rows, columns=header)
 
-def build_url(municipio: str) -> str:
-    parts = [BASE, slugify(municipio)]
+def url_filters_suffix() -> str:
+    """Segmentos de filtro de la URL: son constantes en toda la ejecución."""
+    parts = []
 
     if LONG_TERM:
         parts.append("con-alquiler-de-larga-temporada")
@@ -82,7 +88,12 @@ def build_url(municipio: str) -> str:
     if GOOD_CONDITION:
         parts.append("con-buen-estado")
 
-    return "/".join(parts) + "/"
+    return "".join(f"/{p}" for p in parts) + "/"
+
+def build_urls(municipios: pd.Series) -> pd.Series:
+    # El sufijo se calcula una vez; por municipio solo queda el slug
+    suffix = url_filters_suffix()
+    return BASE + "/" + slugify_series(municipios) + suffix
 
 def main():
     if not SHEET_ID:
@@ -101,13 +112,11 @@ def main():
         df[MUNICIPIO_COL].astype(str).str.strip()
         .replace({"nan": ""})
     )
-    municipios = [m for m in municipios.unique().tolist() if m]
-
-    out = []
-    for m in municipios:
-        out.append({"municipio": m, "idealista_url": build_url(m)})
+    municipios = pd.Series(municipios.unique())
+    municipios = municipios[municipios != ""].reset_index(drop=True)
 
-    pd.DataFrame(out).to_csv("urls.csv", index=False, encoding="utf-8")
+    out = pd.DataFrame({"municipio": municipios, "idealista_url": build_urls(municipios)})
+    out.to_csv("urls.csv", index=False, encoding="utf-8")
     print("OK -> urls.csv")
 
 if __name__ == "__main__":
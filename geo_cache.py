@@ -0,0 +1,76 @@
+import sqlite3
+import threading
+from typing import Any, Dict, Optional
+
+
+class GeoCache:
+    """
+    Caché de geocodificación persistente en SQLite, con interfaz tipo dict:
+      cache[key] -> {"lat", "lon", "display"} o None (consulta sin resultado)
+    Cada escritura es un INSERT de una fila, no se reescribe el fichero entero.
+    Con commit_every > 1 se confirma por lotes; flush()/close() confirman el resto.
+    """
+
+    def __init__(self, path: str, commit_every: int = 1):
+        # Streamlit atiende cada sesión en un hilo distinto
+        self._con = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._commit_every = max(commit_every, 1)
+        self._pending = 0
+        with self._lock:
+            # WAL: escrituras O(1) en el log, lectores no bloquean al escritor
+            self._con.execute("PRAGMA journal_mode=WAL")
+            self._con.execute(
+                "CREATE TABLE IF NOT EXISTS geo ("
+                " key TEXT PRIMARY KEY, lat REAL, lon REAL, display TEXT)"
+            )
+            self._con.commit()
+
+    def _row(self, key: str):
+        with self._lock:
+            return self._con.execute(
+                "SELECT lat, lon, display FROM geo WHERE key = ?", (key,)
+            ).fetchone()
+
+    def __contains__(self, key: str) -> bool:
+        return self._row(key) is not None
+
+    def __getitem__(self, key: str) -> Optional[Dict[str, Any]]:
+        row = self._row(key)
+        if row is None:
+            raise KeyError(key)
+        lat, lon, display = row
+        if lat is None:
+            return None
+        return {"lat": lat, "lon": lon, "display": display}
+
+    def __setitem__(self, key: str, value: Optional[Dict[str, Any]]) -> None:
+        if value is None:
+            params = (key, None, None, None)
+        else:
+            params = (key, value["lat"], value["lon"], value.get("display"))
+        with self._lock:
+            self._con.execute(
+                "INSERT OR REPLACE INTO geo (key, lat, lon, display) VALUES (?, ?, ?, ?)",
+                params,
+            )
+            self._pending += 1
+            if self._pending >= self._commit_every:
+                self._con.commit()
+                self._pending = 0
+
+    def get(self, key: str, default: Any = None) -> Any:
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def flush(self) -> None:
+        with self._lock:
+            self._con.commit()
+            self._pending = 0
+
+    def close(self) -> None:
+        self.flush()
+        with self._lock:
+            self._con.close()
@@ -1,6 +1,8 @@
-import os, re, glob
+import os, re, glob, mmap
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 import pandas as pd
-from bs4 import BeautifulSoup
+import lxml.html
 
 HTML_DIR = "saved_html"
 M2_OBJ = 70
@@ -9,13 +11,39 @@ HIGH = 650
 
 PRICE_RE = re.compile(r"(Average price|Precio medio)\s*:\s*([\d\.,]+)\s*(eur|€)\s*/\s*m²", re.IGNORECASE)
 
+# Prefiltro sobre los bytes crudos: sin ninguna de estas cadenas PRICE_RE no puede
+# casar y el fichero se descarta sin decodificar ni parsear (búsqueda de bytes en C).
+# Cubre las mayúsculas habituales (PRICE_RE es IGNORECASE).
+PRICE_KEYS = tuple({
+    case(phrase).encode("utf-8")
+    for phrase in ("average price", "precio medio")
+    for case in (str.lower, str.capitalize, str.title, str.upper)
+})
+
+_HTML_PARSER = lxml.html.HTMLParser(encoding="utf-8")
+
+def html_text(raw: bytes) -> str:
+    """Texto visible (sin script/style), trozos separados por espacio como get_text(" ", strip=True)."""
+    doc = lxml.html.fromstring(raw, parser=_HTML_PARSER)
+    parts = doc.xpath("//text()[not(parent::script) and not(parent::style)]")
+    return " ".join(t.strip() for t in parts if t.strip())
+
 def parse_price_m2(path: str):
-    with open(path, "r", encoding="utf-8", errors="ignore") as f:
-        html = f.read()
-    soup = BeautifulSoup(html, "html.parser")
-    text = soup.get_text(" ", strip=True)
+    # mmap: el prefiltro busca sobre la page cache sin copiar el fichero a un bytes;
+    # solo los que pasan se copian para decodificar/parsear
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:  # mmap no admite ficheros vacíos
+            return None
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if not any(mm.find(k) != -1 for k in PRICE_KEYS):
+                return None
+            raw = mm[:]
 
-    m = PRICE_RE.search(text)
+    # Casi siempre el precio está en un único nodo de texto: se busca primero en el
+    # HTML tal cual y solo si falla se parsea el documento para sacar el texto.
+    m = PRICE_RE.search(raw.decode("utf-8", errors="ignore"))
+    if not m:
+        m = PRICE_RE.search(html_text(raw))
     if not m:
         return None
     raw = m.group(2).replace(".", "").replace(",", ".")
@@ -24,33 +52,41 @@ def parse_price_m2(path: str):
     except:
         return None
 
-def classify(rent):
-    if rent is None or (isinstance(rent, float) and pd.isna(rent)):
-        return "SIN DATO"
-    if rent <= LOW:
-        return "BARATO"
-    if rent <= HIGH:
-        return "MEDIO"
-    return "CARO"
+# En orden alfabético: ordenar por código == ordenar por etiqueta
+CATEGORIAS = np.array(["BARATO", "CARO", "MEDIO", "SIN DATO"])
+
+def classify_codes(rent: np.ndarray) -> np.ndarray:
+    """Índices en CATEGORIAS para un array de alquileres (NaN -> SIN DATO)."""
+    return np.select([np.isnan(rent), rent <= LOW, rent <= HIGH], [3, 0, 2], default=1)
 
 def main():
     files = glob.glob(os.path.join(HTML_DIR, "*.html")) + glob.glob(os.path.join(HTML_DIR, "*.htm"))
     if not files:
         raise SystemExit(f"No hay HTML en {HTML_DIR}/")
 
-    rows = []
-    for f in files:
-        precio_m2 = parse_price_m2(f)
-        alquiler = (precio_m2 * M2_OBJ) if precio_m2 else None
-        rows.append({
-            "file": os.path.basename(f),
-            "precio_m2": precio_m2,
-            "m2_obj": M2_OBJ,
-            "alquiler_estimado": alquiler,
-            "categoria_600_650": classify(alquiler),
-        })
-
-    df = pd.DataFrame(rows).sort_values(["categoria_600_650", "alquiler_estimado"], na_position="last")
+    # Cada fichero es independiente y el parseo es CPU: un proceso por núcleo
+    workers = os.cpu_count() or 1
+    chunksize = max(1, len(files) // (4 * workers))
+    with ProcessPoolExecutor(max_workers=workers) as ex:
+        precios = list(ex.map(parse_price_m2, files, chunksize=chunksize))
+
+    # Columnas como arrays float64 (None -> NaN); sin precio o precio 0 -> sin alquiler
+    precio_m2 = np.asarray(precios, dtype=np.float64)
+    alquiler = precio_m2 * M2_OBJ
+    alquiler[precio_m2 == 0] = np.nan
+    codes = classify_codes(alquiler)
+
+    # Orden por (categoría, alquiler) con NaN al final, sobre arrays numéricos:
+    # los códigos siguen el orden alfabético de las etiquetas
+    order = np.lexsort((np.nan_to_num(alquiler, nan=np.inf), codes))
+
+    df = pd.DataFrame({
+        "file": [os.path.basename(f) for f in files],
+        "precio_m2": precio_m2,
+        "m2_obj": M2_OBJ,
+        "alquiler_estimado": alquiler,
+        "categoria_600_650": CATEGORIAS[codes],
+    }).iloc[order]
     df.to_csv("precios_extraidos.csv", index=False, encoding="utf-8")
     print("OK -> precios_extraidos.csv")
 
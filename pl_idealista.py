@@ -1,9 +1,15 @@
+import hashlib
+import json
+import os
 import re
 import pandas as pd
+import pyarrow.csv as pacsv
 import requests
 import streamlit as st
 
 SHEET_URL = "https://docs.google.com/spreadsheets/d/1jA5XefBVg7D-pFvBN0RoVx35iegU6fc5XL6BDOh3D14/edit?gid=0#gid=0"
+# Copia en disco del CSV: sobrevive a reinicios de Streamlit (st.cache_data vive solo en RAM)
+CACHE_DIR = os.path.expanduser(os.getenv("SHEET_CACHE_DIR", "~/.cache/destinos_ahp"))
 
 
 def sheet_edit_url_to_csv_export(url: str) -> str:
@@ -26,15 +32,54 @@ def sheet_edit_url_to_csv_export(url: str) -> str:
     return f"https://docs.google.com/spreadsheets/d/{sheet_id}/export?format=csv&gid={gid}"
 
 
-@st.cache_data(show_spinner=False)
-def load_google_sheet_as_df(sheet_url: str) -> pd.DataFrame:
+def _write_atomic(path: str, data: bytes) -> None:
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def download_sheet_csv(sheet_url: str) -> str:
+    """
+    Descarga el CSV del sheet a CACHE_DIR y devuelve la ruta local.
+    Envía el ETag/Last-Modified guardados en <hash>.meta.json: si Google
+    responde 304 se reutiliza el fichero ya descargado.
+    """
     csv_url = sheet_edit_url_to_csv_export(sheet_url)
-    r = requests.get(csv_url, timeout=30)
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    key = hashlib.sha1(sheet_url.encode("utf-8")).hexdigest()
+    csv_path = os.path.join(CACHE_DIR, f"{key}.csv")
+    meta_path = os.path.join(CACHE_DIR, f"{key}.meta.json")
+
+    headers = {}
+    if os.path.exists(csv_path) and os.path.exists(meta_path):
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+
+    r = requests.get(csv_url, headers=headers, timeout=30)
+    if r.status_code == 304:
+        return csv_path
     r.raise_for_status()
 
-    # pandas puede leer desde texto CSV directamente
-    from io import StringIO
-    return pd.read_csv(StringIO(r.text))
+    _write_atomic(csv_path, r.content)
+    meta = {"etag": r.headers.get("ETag"), "last_modified": r.headers.get("Last-Modified")}
+    _write_atomic(meta_path, json.dumps(meta).encode("utf-8"))
+    return csv_path
+
+
+@st.cache_data(show_spinner=False)
+def load_google_sheet_as_df(sheet_url: str) -> pd.DataFrame:
+    csv_path = download_sheet_csv(sheet_url)
+    # Lector CSV de Arrow sobre los bytes del fichero: multihilo y sin pasar por str
+    table = pacsv.read_csv(
+        csv_path,
+        read_options=pacsv.ReadOptions(use_threads=True, block_size=1 << 20),
+    )
+    return table.to_pandas(types_mapper=pd.ArrowDtype)
 
 
 def main():
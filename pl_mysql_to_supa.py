@@ -1,23 +1,69 @@
+import io
 import os
 import json
+import queue
 import re
+import struct
+import threading
 import time
-from typing import Any, Dict, List, Tuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import closing
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
 
 import mysql.connector
-import psycopg2
+from mysql.connector import HAVE_CEXT
+from mysql.connector.pooling import MySQLConnectionPool
 from psycopg2 import sql
 from psycopg2.extras import execute_values
+from psycopg2.pool import ThreadedConnectionPool
 from dotenv import load_dotenv
 
+try:
+    import orjson  # opcional: parser JSON en C, 2-5x más rápido
+except ImportError:
+    orjson = None
+
 
 # ----------------------------
 # Utils
 # ----------------------------
+_NON_WORD = re.compile(r"[^a-z0-9_]+")
+_MULTI_US = re.compile(r"_+")
+_PAREN_2 = re.compile(r"\((\d+),(\d+)\)")
+_PAREN_1 = re.compile(r"\((\d+)\)")
+_NUM_LIT = re.compile(r"[-+]?\d+(\.\d+)?")
+
+# Tipos MySQL cuya traducción no depende de COLUMN_TYPE
+_MYSQL_TO_PG: Dict[str, str] = {
+    "int": "integer",
+    "integer": "integer",
+    "mediumint": "integer",
+    "bigint": "bigint",
+    "smallint": "smallint",
+    "float": "real",
+    "double": "double precision",
+    "text": "text",
+    "mediumtext": "text",
+    "longtext": "text",
+    "datetime": "timestamp",
+    "timestamp": "timestamptz",
+    "date": "date",
+    "time": "time",
+    "json": "jsonb",
+    "blob": "bytea",
+    "mediumblob": "bytea",
+    "longblob": "bytea",
+    "binary": "bytea",
+    "varbinary": "bytea",
+}
+
+
 def normalize_ident(name: str) -> str:
     s = str(name).strip().lower()
-    s = re.sub(r"[^a-z0-9_]+", "_", s)
-    s = re.sub(r"_+", "_", s).strip("_")
+    s = _NON_WORD.sub("_", s)
+    s = _MULTI_US.sub("_", s).strip("_")
     if not s:
         s = "col"
     if s[0].isdigit():
@@ -26,90 +72,246 @@ def normalize_ident(name: str) -> str:
 
 
 def dedupe_idents(idents: List[str]) -> List[str]:
-    seen = {}
+    # Caso habitual: no hay repetidos
+    if len(set(idents)) == len(idents):
+        return list(idents)
+
+    # La primera aparición conserva el nombre; las siguientes llevan _2, _3...
+    counts: Dict[str, int] = {}
+    counts_get = counts.get
     out = []
     for x in idents:
-        if x not in seen:
-            seen[x] = 1
-            out.append(x)
-        else:
-            seen[x] += 1
-            out.append(f"{x}_{seen[x]}")
+        n = counts_get(x, 0) + 1
+        counts[x] = n
+        out.append(x if n == 1 else f"{x}_{n}")
     return out
 
 
 def map_mysql_to_pg(data_type: str, column_type: str) -> str:
     dt = (data_type or "").lower()
-    ct = (column_type or "").lower()
+    pg_type = _MYSQL_TO_PG.get(dt)
+    if pg_type is not None:
+        return pg_type
 
-    if dt in ("int", "integer", "mediumint"):
-        return "integer"
-    if dt == "bigint":
-        return "bigint"
-    if dt == "smallint":
-        return "smallint"
+    # Solo estos dependen del tamaño/modificador de COLUMN_TYPE
+    ct = (column_type or "").lower()
     if dt == "tinyint":
         return "boolean" if "tinyint(1)" in ct else "smallint"
 
     if dt in ("decimal", "numeric"):
-        m = re.search(r"\((\d+),(\d+)\)", ct)
+        m = _PAREN_2.search(ct)
         return f"numeric({m.group(1)},{m.group(2)})" if m else "numeric"
 
-    if dt == "float":
-        return "real"
-    if dt == "double":
-        return "double precision"
-
     if dt in ("varchar", "char"):
-        m = re.search(r"\((\d+)\)", ct)
+        m = _PAREN_1.search(ct)
         return f"varchar({m.group(1)})" if m else "text"
 
-    if dt in ("text", "mediumtext", "longtext"):
-        return "text"
+    return "text"
 
-    if dt == "datetime":
-        return "timestamp"
-    if dt == "timestamp":
-        return "timestamptz"
-    if dt == "date":
-        return "date"
-    if dt == "time":
-        return "time"
 
-    if dt == "json":
-        return "jsonb"
+# ----------------------------
+# COPY binario (encoders por tipo PG)
+# ----------------------------
+_PG_EPOCH_DATE = date(2000, 1, 1)
+_PG_EPOCH_TS = datetime(2000, 1, 1)
+_ONE_US = timedelta(microseconds=1)
 
-    if dt in ("blob", "mediumblob", "longblob", "binary", "varbinary"):
-        return "bytea"
+_COPY_HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack("!ii", 0, 0)  # firma + flags + ext
+_COPY_TRAILER = struct.pack("!h", -1)
+_COPY_NULL = struct.pack("!i", -1)
 
-    return "text"
+
+def _enc_text(v: Any) -> bytes:
+    if isinstance(v, (bytes, bytearray)):
+        return bytes(v)
+    return str(v).encode("utf-8")
+
+
+def _enc_bytea(v: Any) -> bytes:
+    return bytes(v)
+
+
+def _enc_time(v: Any) -> bytes:
+    # MySQL devuelve TIME como timedelta
+    if isinstance(v, timedelta):
+        return struct.pack("!q", v // _ONE_US)
+    return struct.pack("!q", ((v.hour * 60 + v.minute) * 60 + v.second) * 1_000_000 + v.microsecond)
+
+
+def _enc_jsonb(v: Any) -> bytes:
+    return b"\x01" + _enc_text(v)  # versión 1 del formato jsonb
+
+
+def _enc_numeric(v: Any) -> bytes:
+    """numeric binario: ndigits, weight, sign, dscale + dígitos en base 10000."""
+    d = v if isinstance(v, Decimal) else Decimal(str(v))
+    if d.is_nan():
+        return struct.pack("!hhHh", 0, 0, 0xC000, 0)
+
+    sign, digits, exp = d.as_tuple()
+    dscale = max(-exp, 0)
+    # s = |d| * 10^dscale como texto, con al menos un dígito entero
+    s = "".join(map(str, digits)) + "0" * max(exp, 0)
+    s = s.rjust(dscale + 1, "0")
+    int_part, frac = s[:len(s) - dscale], s[len(s) - dscale:]
+    int_part = int_part.rjust(-(-len(int_part) // 4) * 4, "0")
+    frac = frac.ljust(-(-len(frac) // 4) * 4, "0")
+
+    groups = [int(int_part[i:i + 4]) for i in range(0, len(int_part), 4)]
+    groups += [int(frac[i:i + 4]) for i in range(0, len(frac), 4)]
+    weight = len(int_part) // 4 - 1
+    while groups and groups[0] == 0:
+        groups.pop(0)
+        weight -= 1
+    while groups and groups[-1] == 0:
+        groups.pop()
+    if not groups:
+        weight = 0
+
+    return struct.pack(
+        f"!hhHh{len(groups)}h",
+        len(groups), weight, 0x4000 if (sign and groups) else 0, dscale, *groups,
+    )
+
+
+# Tipos PG (sin modificador) con formato binario. Lo que no esté en ninguna de
+# las dos tablas (p.ej. timestamptz, cuya zona horaria es ambigua desde MySQL)
+# va por execute_values.
+
+# Ancho fijo: longitud + valor salen de un único struct.pack.
+# La expresión recibe la variable de la celda en {v}.
+_FIXED_WIDTH: Dict[str, Tuple[str, int, str]] = {
+    "boolean": ("!i?", 1, "{v}"),  # MySQL devuelve tinyint(1) como 0/1
+    "smallint": ("!ih", 2, "{v}"),
+    "integer": ("!ii", 4, "{v}"),
+    "bigint": ("!iq", 8, "{v}"),
+    "real": ("!if", 4, "{v}"),
+    "double precision": ("!id", 8, "{v}"),
+    "date": ("!ii", 4, "({v} - _PG_EPOCH_DATE).days"),
+    # microsegundos desde 2000-01-01 (sin zona, igual que DATETIME de MySQL)
+    "timestamp": ("!iq", 8, "({v} - _PG_EPOCH_TS) // _ONE_US"),
+}
+
+# Longitud variable: encoder que devuelve los bytes del valor
+_VARLEN_ENCODERS: Dict[str, Callable[[Any], bytes]] = {
+    "numeric": _enc_numeric,
+    "varchar": _enc_text,
+    "text": _enc_text,
+    "time": _enc_time,
+    "jsonb": _enc_jsonb,
+    "bytea": _enc_bytea,
+}
+
+
+def build_row_encoder(pg_types: List[str]) -> Optional[Callable[[List[Tuple[Any, ...]], Callable[[bytes], Any]], None]]:
+    """
+    Genera (compile + exec) una función encode_rows(rows, write) específica para
+    el vector de tipos de la tabla: sin bucle por columna ni búsqueda del encoder
+    en cada celda. None si algún tipo no tiene encoder binario.
+    """
+    base_types = [t.split("(")[0] for t in pg_types]
+    if any(t not in _FIXED_WIDTH and t not in _VARLEN_ENCODERS for t in base_types):
+        return None
+
+    ns: Dict[str, Any] = {
+        "_NCOLS": struct.pack("!h", len(base_types)),
+        "_NULL": _COPY_NULL,
+        "_pack_len": struct.Struct("!i").pack,
+        "_PG_EPOCH_DATE": _PG_EPOCH_DATE,
+        "_PG_EPOCH_TS": _PG_EPOCH_TS,
+        "_ONE_US": _ONE_US,
+    }
+    names = [f"v{i}" for i in range(len(base_types))]
+    lines = [
+        "def encode_rows(rows, write):",
+        "    for row in rows:",
+        f"        {', '.join(names)}, = row",
+        "        write(_NCOLS)",
+    ]
+    for i, (v, t) in enumerate(zip(names, base_types)):
+        lines.append(f"        if {v} is None:")
+        lines.append("            write(_NULL)")
+        if t in _FIXED_WIDTH:
+            fmt, size, expr = _FIXED_WIDTH[t]
+            ns[f"_pack{i}"] = struct.Struct(fmt).pack
+            lines.append("        else:")
+            lines.append(f"            write(_pack{i}({size}, {expr.format(v=v)}))")
+        else:
+            # longitud variable: encoder resuelto ya en la generación
+            ns[f"_enc{i}"] = _VARLEN_ENCODERS[t]
+            lines.append("        else:")
+            lines.append(f"            d = _enc{i}({v})")
+            lines.append("            write(_pack_len(len(d)))")
+            lines.append("            write(d)")
+
+    exec(compile("\n".join(lines), "<copy-row-encoder>", "exec"), ns)
+    return ns["encode_rows"]
+
+
+def copy_binary_buffer(
+    rows: List[Tuple[Any, ...]],
+    encode_rows: Callable[[List[Tuple[Any, ...]], Callable[[bytes], Any]], None],
+) -> io.BytesIO:
+    buf = io.BytesIO()
+    buf.write(_COPY_HEADER)
+    encode_rows(rows, buf.write)
+    buf.write(_COPY_TRAILER)
+    buf.seek(0)
+    return buf
 
 
 # ----------------------------
 # Connections
 # ----------------------------
-def mysql_conn():
-    return mysql.connector.connect(
+# MySQLConnectionPool no admite más de 32 conexiones
+MYSQL_POOL_MAX = 32
+
+
+def mysql_config() -> Dict[str, Any]:
+    return dict(
         host=os.getenv("MYSQL_HOST", "127.0.0.1"),
         port=int(os.getenv("MYSQL_PORT", "3306")),
         user=os.getenv("MYSQL_USER"),
         password=os.getenv("MYSQL_PASSWORD"),
         database=os.getenv("MYSQL_DATABASE"),
+        # extensión C: decodifica las filas en C en vez de en Python
+        use_pure=not HAVE_CEXT,
     )
 
 
-def supa_pg_conn():
+def mysql_conn():
+    return mysql.connector.connect(**mysql_config())
+
+
+def mysql_pool(size: int) -> MySQLConnectionPool:
+    # El pool abre sus `size` conexiones al crearse. Sin reset de sesión al devolverlas:
+    # no usamos estado de sesión, y así se puede devolver una conexión ya cerrada
+    # (discard_mysql_conn), que el pool reconecta en el siguiente get_connection()
+    return MySQLConnectionPool(
+        pool_name="ingest", pool_size=size, pool_reset_session=False, **mysql_config()
+    )
+
+
+def discard_mysql_conn(my) -> None:
+    """Cierra la conexión física de una conexión del pool (p.ej. con filas sin leer)."""
+    cnx = getattr(my, "_cnx", None) or my  # PooledMySQLConnection no expone la conexión real
+    try:
+        cnx.close()
+    except Exception:
+        pass
+
+
+def supa_pg_pool(size: int) -> ThreadedConnectionPool:
     dsn = os.getenv("SUPABASE_PG_DSN", "").strip()
     if not dsn:
         raise SystemExit("Falta SUPABASE_PG_DSN en el .env")
-    return psycopg2.connect(dsn, connect_timeout=20)
+    return ThreadedConnectionPool(1, size, dsn, connect_timeout=20)
 
 
 # ----------------------------
 # Metadata (MySQL)
 # ----------------------------
-def parse_json_field(s: str) -> Dict[str, Any]:
-    return json.loads(s)
+parse_json_field: Callable[[Any], Dict[str, Any]] = orjson.loads if orjson is not None else json.loads
 
 
 def load_all_metadata(conn) -> List[Dict[str, Any]]:
@@ -123,55 +325,121 @@ def load_all_metadata(conn) -> List[Dict[str, Any]]:
     cur.execute(q)
     rows = cur.fetchall()
     cur.close()
+    # SOURCE/TARGET ya como dict: se parsean una sola vez, aquí. Solo las filas
+    # table->table (el resto se salta) y sin abortar el resto si una está mal.
+    for r in rows:
+        if r["SOURCE_TYPE"] != "table" or r["TARGET_TYPE"] != "table":
+            continue
+        try:
+            r["SOURCE"] = parse_json_field(r["SOURCE"])
+            r["TARGET"] = parse_json_field(r["TARGET"])
+        except (TypeError, ValueError) as e:
+            r["METADATA_ERROR"] = f"SOURCE/TARGET no es JSON válido: {e}"
     return rows or []
 
 
 # ----------------------------
 # MySQL introspection
 # ----------------------------
-def mysql_columns(conn, db: str, table: str) -> List[Dict[str, Any]]:
-    q = """
-    SELECT COLUMN_NAME, COLUMN_TYPE, DATA_TYPE, IS_NULLABLE, COLUMN_DEFAULT
+def catalog_key(cols_by_table: Dict[Tuple[str, str], Any], db: str, table: str) -> Optional[Tuple[str, str]]:
+    """
+    Clave (TABLE_SCHEMA, TABLE_NAME) del catálogo para la tabla pedida en la metadata.
+    Primero coincidencia exacta; si no la hay (servidor con lower_case_table_names
+    y otra capitalización en la metadata), la única que coincida sin mayúsculas.
+    """
+    if (db, table) in cols_by_table:
+        return db, table
+    folded = (db.casefold(), table.casefold())
+    matches = [k for k in cols_by_table if (k[0].casefold(), k[1].casefold()) == folded]
+    return matches[0] if len(matches) == 1 else None
+
+
+def _pairs_filter(alias: str, pairs: List[Tuple[str, str]]) -> str:
+    # (TABLE_SCHEMA, TABLE_NAME) IN ((%s, %s), ...): una consulta para todas las tablas
+    return f"({alias}TABLE_SCHEMA, {alias}TABLE_NAME) IN (" + ", ".join(["(%s, %s)"] * len(pairs)) + ")"
+
+
+def mysql_columns(conn, pairs: List[Tuple[str, str]]) -> Dict[Tuple[str, str], List[Dict[str, Any]]]:
+    """Columnas de todas las tablas origen, por (db, tabla) del catálogo, en orden de posición."""
+    cols_by_table: Dict[Tuple[str, str], List[Dict[str, Any]]] = {}
+    if not pairs:
+        return cols_by_table
+    q = f"""
+    SELECT TABLE_SCHEMA, TABLE_NAME, COLUMN_NAME, COLUMN_TYPE, DATA_TYPE, IS_NULLABLE, COLUMN_DEFAULT
     FROM information_schema.COLUMNS
-    WHERE TABLE_SCHEMA=%s AND TABLE_NAME=%s
-    ORDER BY ORDINAL_POSITION
+    WHERE {_pairs_filter("", pairs)}
+    ORDER BY TABLE_SCHEMA, TABLE_NAME, ORDINAL_POSITION
     """
     cur = conn.cursor(dictionary=True)
-    cur.execute(q, (db, table))
-    cols = cur.fetchall()
+    cur.execute(q, [x for p in pairs for x in p])
+    for c in cur.fetchall():
+        cols_by_table.setdefault((c.pop("TABLE_SCHEMA"), c.pop("TABLE_NAME")), []).append(c)
     cur.close()
-    if not cols:
-        raise RuntimeError(f"No encontré columnas para {db}.{table}")
-    return cols
+    return cols_by_table
 
 
-def mysql_pk(conn, db: str, table: str) -> List[str]:
-    q = """
-    SELECT k.COLUMN_NAME
+def mysql_pk(conn, pairs: List[Tuple[str, str]]) -> Dict[Tuple[str, str], List[str]]:
+    """Columnas de la PK de todas las tablas origen, por (db, tabla) del catálogo."""
+    pk_by_table: Dict[Tuple[str, str], List[str]] = {}
+    if not pairs:
+        return pk_by_table
+    q = f"""
+    SELECT t.TABLE_SCHEMA, t.TABLE_NAME, k.COLUMN_NAME
     FROM information_schema.TABLE_CONSTRAINTS t
     JOIN information_schema.KEY_COLUMN_USAGE k
       ON t.CONSTRAINT_NAME=k.CONSTRAINT_NAME
      AND t.TABLE_SCHEMA=k.TABLE_SCHEMA
      AND t.TABLE_NAME=k.TABLE_NAME
-    WHERE t.TABLE_SCHEMA=%s AND t.TABLE_NAME=%s AND t.CONSTRAINT_TYPE='PRIMARY KEY'
-    ORDER BY k.ORDINAL_POSITION
+    WHERE {_pairs_filter("t.", pairs)} AND t.CONSTRAINT_TYPE='PRIMARY KEY'
+    ORDER BY t.TABLE_SCHEMA, t.TABLE_NAME, k.ORDINAL_POSITION
     """
     cur = conn.cursor()
-    cur.execute(q, (db, table))
-    pk = [r[0] for r in cur.fetchall()]
+    cur.execute(q, [x for p in pairs for x in p])
+    for db, table, col in cur.fetchall():
+        pk_by_table.setdefault((db, table), []).append(col)
     cur.close()
-    return pk
+    return pk_by_table
 
 
 # ----------------------------
 # Supabase DDL + load
 # ----------------------------
+# udt_name de information_schema -> nombre de tipo que usa map_mysql_to_pg (sin modificador)
+_PG_UDT_TO_TYPE: Dict[str, str] = {
+    "int2": "smallint",
+    "int4": "integer",
+    "int8": "bigint",
+    "bool": "boolean",
+    "float4": "real",
+    "float8": "double precision",
+}
+
+
+def pg_existing_tables(pg) -> Dict[Tuple[str, str], Dict[str, str]]:
+    """
+    (schema, tabla) ya existentes en Supabase -> {columna: tipo sin modificador},
+    en una sola consulta. Los tipos reales del destino deciden si vale COPY binario.
+    """
+    q = """
+    SELECT table_schema, table_name, column_name, udt_name
+    FROM information_schema.columns
+    WHERE table_schema NOT IN ('pg_catalog', 'information_schema')
+    """
+    existing: Dict[Tuple[str, str], Dict[str, str]] = {}
+    with pg.cursor() as cur:
+        cur.execute(q)
+        for schema, table, col, udt in cur.fetchall():
+            existing.setdefault((schema, table), {})[col] = _PG_UDT_TO_TYPE.get(udt, udt)
+    return existing
+
+
 def ensure_schema_and_table(
     pg,
     schema: str,
     table: str,
     mysql_cols: List[Dict[str, Any]],
     mysql_pk_cols: List[str],
+    existing: Dict[Tuple[str, str], Dict[str, str]],
 ) -> Tuple[str, str, List[str], List[str]]:
     schema_norm = normalize_ident(schema)
     table_norm = normalize_ident(table)
@@ -179,6 +447,10 @@ def ensure_schema_and_table(
     mysql_col_names = [c["COLUMN_NAME"] for c in mysql_cols]
     pg_col_names = dedupe_idents([normalize_ident(x) for x in mysql_col_names])
 
+    # CREATE ... IF NOT EXISTS no cambiaría una tabla existente: nos ahorramos el round-trip
+    if (schema_norm, table_norm) in existing:
+        return schema_norm, table_norm, pg_col_names, mysql_col_names
+
     # PK normalizada
     pk_norm = []
     if mysql_pk_cols:
@@ -186,8 +458,10 @@ def ensure_schema_and_table(
         pk_norm = [name_map[x] for x in mysql_pk_cols if x in name_map]
 
     col_defs_sql = []
+    created_types = {}
     for c, pg_name in zip(mysql_cols, pg_col_names):
         pg_type = map_mysql_to_pg(c["DATA_TYPE"], c["COLUMN_TYPE"])
+        created_types[pg_name] = pg_type.split("(")[0]
         nullable = (c["IS_NULLABLE"] == "YES")
 
         default = c["COLUMN_DEFAULT"]
@@ -199,7 +473,7 @@ def ensure_schema_and_table(
                 elif str(default) in ("1", "true", "TRUE"):
                     default_sql = sql.SQL(" DEFAULT true")
             elif pg_type.startswith(("integer", "bigint", "smallint", "numeric", "real", "double")):
-                if re.fullmatch(r"[-+]?\d+(\.\d+)?", str(default)):
+                if _NUM_LIT.fullmatch(str(default)):
                     default_sql = sql.SQL(" DEFAULT ") + sql.SQL(str(default))
             elif pg_type == "text" or pg_type.startswith("varchar"):
                 default_sql = sql.SQL(" DEFAULT ") + sql.Literal(str(default))
@@ -234,11 +508,13 @@ def ensure_schema_and_table(
     with pg.cursor() as cur:
         cur.execute(ddl)
     pg.commit()
+    existing[(schema_norm, table_norm)] = created_types
 
     return schema_norm, table_norm, pg_col_names, mysql_col_names
 
 
 def maybe_truncate(pg, schema_norm: str, table_norm: str, mode: str):
+    # Sin commit: el TRUNCATE va en la misma transacción que la carga
     if mode == "replace":
         with pg.cursor() as cur:
             cur.execute(
@@ -246,7 +522,48 @@ def maybe_truncate(pg, schema_norm: str, table_norm: str, mode: str):
                     sql.Identifier(schema_norm), sql.Identifier(table_norm)
                 )
             )
-        pg.commit()
+
+
+def fetch_batches_in_background(cur, batch_size: int, depth: int = 2) -> Iterator[List[Tuple[Any, ...]]]:
+    """
+    Lee lotes del cursor MySQL en un hilo aparte mientras el llamante escribe
+    en Postgres. La cola acotada (depth lotes) mantiene la memoria constante.
+    """
+    batches: "queue.Queue[Any]" = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+
+    def _put(item: Any) -> None:
+        # put con timeout para no quedarse bloqueado si el consumidor ha abortado
+        while not stop.is_set():
+            try:
+                batches.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def _reader() -> None:
+        try:
+            while not stop.is_set():
+                rows = cur.fetchmany(batch_size)
+                _put(rows)
+                if not rows:
+                    return
+        except Exception as e:
+            _put(e)
+
+    reader = threading.Thread(target=_reader, name="mysql-reader", daemon=True)
+    reader.start()
+    try:
+        while True:
+            item = batches.get()
+            if isinstance(item, Exception):
+                raise item
+            if not item:
+                return
+            yield item
+    finally:
+        stop.set()
+        reader.join()
 
 
 def load_data(
@@ -258,31 +575,132 @@ def load_data(
     table_norm: str,
     pg_cols: List[str],
     mysql_cols: List[str],
+    pg_types: Optional[List[str]],
     batch_size: int,
+    checkpoint_batches: int = 0,
 ):
     select_sql = "SELECT " + ", ".join(f"`{c}`" for c in mysql_cols) + f" FROM `{src_db}`.`{src_table}`"
-    mcur = my.cursor()
-    mcur.execute(select_sql)
 
-    insert_stmt = sql.SQL("INSERT INTO {}.{} ({}) VALUES %s").format(
+    target = sql.SQL("{}.{} ({})").format(
         sql.Identifier(schema_norm),
         sql.Identifier(table_norm),
         sql.SQL(", ").join(sql.Identifier(c) for c in pg_cols),
     )
+    insert_stmt = sql.SQL("INSERT INTO {} VALUES %s").format(target)
+    copy_stmt = sql.SQL("COPY {} FROM STDIN WITH (FORMAT BINARY)").format(target)
 
-    total = 0
-    with pg.cursor() as pcur:
-        while True:
-            rows = mcur.fetchmany(batch_size)
-            if not rows:
-                break
-            execute_values(pcur, insert_stmt, rows, page_size=len(rows))
-            pg.commit()
-            total += len(rows)
+    # COPY binario si todos los tipos tienen encoder; si no (o pg_types=None), INSERT multi-fila
+    encode_rows = build_row_encoder(pg_types) if pg_types else None
+    print(f"[INFO] {schema_norm}.{table_norm}: carga vía {'COPY binario' if encode_rows else 'execute_values'}")
+
+    # Sentencia preparada (protocolo binario): sin parseo de texto por celda.
+    # Este cursor no admite buffered=True: las filas se van leyendo del servidor.
+    mcur = my.cursor(prepared=True)
+    try:
+        mcur.execute(select_sql)
+
+        # Una transacción por ingestión; checkpoint_batches > 0 confirma cada N lotes
+        # (solo en append: en replace confirmaría también el TRUNCATE)
+        total = 0
+        with pg.cursor() as pcur, closing(fetch_batches_in_background(mcur, batch_size)) as batches:
+            for n_batch, rows in enumerate(batches, start=1):
+                if encode_rows:
+                    pcur.copy_expert(copy_stmt, copy_binary_buffer(rows, encode_rows))
+                else:
+                    execute_values(pcur, insert_stmt, rows, page_size=batch_size)
+                total += len(rows)
+                if checkpoint_batches and n_batch % checkpoint_batches == 0:
+                    pg.commit()
+        pg.commit()
+    except Exception:
+        # Primero Postgres: en replace suelta ya el lock del TRUNCATE
+        pg.rollback()
+        # Quedan filas sin leer: en vez de traer el resto de la tabla se cierra la
+        # conexión MySQL, así devolverla al pool no lanza "Unread result found"
+        discard_mysql_conn(my)
+        raise
     mcur.close()
     return total
 
 
+def run_ingestion(
+    m: Dict[str, Any],
+    my_pool: MySQLConnectionPool,
+    pg_pool: ThreadedConnectionPool,
+    cols_by_table: Dict[Tuple[str, str], List[Dict[str, Any]]],
+    pk_by_table: Dict[Tuple[str, str], List[str]],
+    existing: Dict[Tuple[str, str], Dict[str, str]],
+    ddl_lock: threading.Lock,
+    load_mode: str,
+    fixed_schema: str,
+    use_target_schema: bool,
+    batch_size: int,
+    checkpoint_batches: int,
+) -> Optional[int]:
+    """Una ingestión completa (DDL -> carga) con conexiones del pool."""
+    name = m["INGESTION_NAME"]
+    if m["SOURCE_TYPE"] != "table" or m["TARGET_TYPE"] != "table":
+        print(f"[SKIP] {name} (solo soporta table->table)")
+        return None
+    if "METADATA_ERROR" in m:
+        raise RuntimeError(m["METADATA_ERROR"])
+
+    source = m["SOURCE"]
+    target = m["TARGET"]
+
+    src_db = source["database"]
+    src_table = source["table"]
+
+    tgt_schema = normalize_ident(target.get("database", fixed_schema)) if use_target_schema else fixed_schema
+    tgt_table = target["table"]
+
+    print(f"[INFO] Ingestión: {name} | Origen: {src_db}.{src_table} | Destino: {tgt_schema}.{tgt_table}")
+
+    key = catalog_key(cols_by_table, src_db, src_table)
+    cols = cols_by_table.get(key) if key else None
+    if not cols:
+        raise RuntimeError(f"No encontré columnas para {src_db}.{src_table}")
+    pk = pk_by_table.get(key, [])
+
+    my = my_pool.get_connection()
+    pg = pg_pool.getconn()
+    try:
+        if load_mode == "replace":
+            # Carga idempotente (se re-ejecuta tras el TRUNCATE): no esperamos al flush del WAL
+            with pg.cursor() as cur:
+                cur.execute("SET synchronous_commit = off")
+            pg.commit()
+
+        # CREATE SCHEMA concurrentes sobre el mismo schema pueden chocar en el catálogo
+        with ddl_lock:
+            schema_norm, table_norm, pg_cols, mysql_cols = ensure_schema_and_table(
+                pg, tgt_schema, tgt_table, cols, pk, existing
+            )
+            target_types = existing[(schema_norm, table_norm)]
+
+        # COPY binario no hace casts implícitos: solo si el destino tiene exactamente los
+        # tipos que saldrían de MySQL hoy (p.ej. int ampliado a bigint tras crear la tabla)
+        pg_types = [map_mysql_to_pg(c["DATA_TYPE"], c["COLUMN_TYPE"]) for c in cols]
+        if [target_types.get(c) for c in pg_cols] != [t.split("(")[0] for t in pg_types]:
+            print(f"[INFO] {schema_norm}.{table_norm}: tipos de destino distintos del origen, sin COPY binario")
+            pg_types = None
+        try:
+            maybe_truncate(pg, schema_norm, table_norm, load_mode)
+            total = load_data(
+                my, pg, src_db, src_table, schema_norm, table_norm, pg_cols, mysql_cols, pg_types,
+                batch_size, 0 if load_mode == "replace" else checkpoint_batches,
+            )
+        except Exception:
+            # replace: deshace TRUNCATE y carga; append: los lotes desde el último checkpoint
+            pg.rollback()
+            raise
+        print(f"[DONE] {name}: insertadas {total} filas")
+        return total
+    finally:
+        pg_pool.putconn(pg, close=bool(pg.closed))
+        my.close()  # en una conexión del pool, la devuelve
+
+
 def main():
     load_dotenv()
 
@@ -292,7 +710,11 @@ def main():
 
     # modo y defaults
     load_mode = os.getenv("LOAD_MODE", "append").strip().lower()  # append|replace
-    batch_size = int(os.getenv("BATCH_SIZE", "500"))
+    batch_size = int(os.getenv("BATCH_SIZE", "10000"))
+    checkpoint_batches = int(os.getenv("CHECKPOINT_BATCHES", "0"))  # solo append; 0 = solo commit final
+    max_workers = int(os.getenv("INGEST_WORKERS", "8"))  # ingestiones en paralelo
+    if max_workers < 1:
+        raise SystemExit("INGEST_WORKERS debe ser >= 1")
 
     # schema destino:
     # - si quieres FORZAR siempre prd_ahp, deja SUPABASE_SCHEMA
@@ -300,51 +722,63 @@ def main():
     fixed_schema = os.getenv("SUPABASE_SCHEMA", "prd_ahp").strip()
     use_target_schema = os.getenv("USE_TARGET_SCHEMA", "0").strip() == "1"
 
+    # Metadata + introspección con una conexión suelta: los pools se dimensionan
+    # después, cuando ya se sabe cuántas ingestiones hay
     my = mysql_conn()
-    pg = supa_pg_conn()
     try:
         metas = load_all_metadata(my)
         if not metas:
             print("[INFO] No hay filas ACTIVE=1 en M_METADATA.")
             return
 
+        # Introspección de todas las tablas origen de golpe: 2 consultas en total
+        pairs = set()
         for m in metas:
-            name = m["INGESTION_NAME"]
-            if m["SOURCE_TYPE"] != "table" or m["TARGET_TYPE"] != "table":
-                print(f"[SKIP] {name} (solo soporta table->table)")
+            if m["SOURCE_TYPE"] != "table" or m["TARGET_TYPE"] != "table" or "METADATA_ERROR" in m:
                 continue
-
-            source = parse_json_field(m["SOURCE"])
-            target = parse_json_field(m["TARGET"])
-
-            src_db = source["database"]
-            src_table = source["table"]
-
-            tgt_schema = normalize_ident(target.get("database", fixed_schema)) if use_target_schema else fixed_schema
-            tgt_table = target["table"]
-
-            print(f"\n[INFO] Ingestión: {name}")
-            print(f"[INFO] Origen: {src_db}.{src_table}")
-            print(f"[INFO] Destino: {tgt_schema}.{tgt_table}")
-
-            cols = mysql_columns(my, src_db, src_table)
-            pk = mysql_pk(my, src_db, src_table)
-
-            schema_norm, table_norm, pg_cols, mysql_cols = ensure_schema_and_table(
-                pg, tgt_schema, tgt_table, cols, pk
-            )
-
-            maybe_truncate(pg, schema_norm, table_norm, load_mode)
-
-            total = load_data(
-                my, pg, src_db, src_table, schema_norm, table_norm, pg_cols, mysql_cols, batch_size
-            )
-            print(f"[DONE] {name}: insertadas {total} filas")
-
+            try:
+                pairs.add((m["SOURCE"]["database"], m["SOURCE"]["table"]))
+            except (KeyError, TypeError):
+                continue  # SOURCE incompleto: falla solo esa ingestión en run_ingestion
+        pairs = sorted(pairs)
+        cols_by_table = mysql_columns(my, pairs)
+        pk_by_table = mysql_pk(my, pairs)
     finally:
-        pg.close()
         my.close()
 
+    workers = min(max_workers, len(metas), MYSQL_POOL_MAX)
+    my_pool = mysql_pool(workers)
+    pg_pool = supa_pg_pool(workers)
+    try:
+        pg = pg_pool.getconn()
+        try:
+            existing = pg_existing_tables(pg)
+        finally:
+            pg_pool.putconn(pg)
+
+        # Cada ingestión es independiente: en paralelo, una conexión MySQL + una PG por hilo
+        ddl_lock = threading.Lock()
+        failed = []
+        with ThreadPoolExecutor(max_workers=workers) as ex:
+            futures = {
+                ex.submit(
+                    run_ingestion, m, my_pool, pg_pool, cols_by_table, pk_by_table, existing, ddl_lock, load_mode,
+                    fixed_schema, use_target_schema, batch_size, checkpoint_batches,
+                ): m["INGESTION_NAME"]
+                for m in metas
+            }
+            for fut in as_completed(futures):
+                try:
+                    fut.result()
+                except Exception as e:
+                    print(f"[ERROR] {futures[fut]}: {e}")
+                    failed.append(futures[fut])
+
+        if failed:
+            raise SystemExit(f"Fallaron {len(failed)} ingestiones: {', '.join(failed)}")
+
+    finally:
+        pg_pool.closeall()
 
 if __name__ == "__main__":
     main()